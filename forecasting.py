@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+
+# ---------- EMISSION FACTORS (same model as the Calculator tab) ----------
+ELECTRICITY_FACTOR = 0.8  # kg CO₂e per kWh
+TRAVEL_FACTOR = 0.12      # kg CO₂e per km
+WASTE_FACTOR = 0.4        # kg CO₂e per kg of waste
+
+# Diet → extra kg CO₂e per month, indexed by DIET_CODES
+DIET_CODES = {"veg": 0, "vegan": 1, "mixed": 2, "nonveg": 3}
+DIET_EXTRA = np.array([0.0, 0.0, 5.0, 10.0])
+
+
+def diet_extra_kg(diet: str) -> float:
+    """Extra kg CO₂e per month for one diet name; the scalar form of DIET_EXTRA."""
+    return float(DIET_EXTRA[DIET_CODES[diet]])
+
+
+# ---------- BATCH MODEL (many households / months / scenarios at once) ----------
+def _emissions_loop(electricity, travel, waste, diet_code, diet_extra):
+    out = np.empty(electricity.shape[0])
+    for i in range(electricity.shape[0]):
+        out[i] = (
+            electricity[i] * ELECTRICITY_FACTOR
+            + travel[i] * TRAVEL_FACTOR
+            + waste[i] * WASTE_FACTOR
+            + diet_extra[diet_code[i]]
+        )
+    return out
+
+
+_kernel = None
+_kernel_lock = threading.Lock()
+
+
+def _emissions_kernel():
+    """The Numba-compiled loop, or None when numba isn't installed."""
+    # numba/llvmlite are imported here, not at module load, so the import cost
+    # lands on the first thread that needs the kernel (normally warm_up's).
+    global _kernel
+    with _kernel_lock:
+        if _kernel is None:
+            try:
+                from numba import njit
+            except ImportError:  # optional: fall back to plain NumPy
+                _kernel = False
+            else:
+                # cache=True stores the compiled kernel on disk, so only the very first launch compiles
+                _kernel = njit(cache=True, fastmath=True)(_emissions_loop)
+        return _kernel or None
+
+
+def encode_diets(diets) -> np.ndarray:
+    """Map diet names ("veg", "vegan", "mixed", "nonveg") to DIET_CODES."""
+    return np.array([DIET_CODES[d] for d in diets], dtype=np.int64)
+
+
+def compute_emissions_batch(electricity, travel, waste, diet_code) -> np.ndarray:
+    """Monthly kg CO₂e for each row of equally long input arrays."""
+    electricity = np.ascontiguousarray(electricity, dtype=np.float64)
+    travel = np.ascontiguousarray(travel, dtype=np.float64)
+    waste = np.ascontiguousarray(waste, dtype=np.float64)
+    diet_code = np.ascontiguousarray(diet_code, dtype=np.int64)
+
+    # The compiled kernel has no bounds checks, so bad input must be caught here
+    if electricity.ndim != 1 or any(a.shape != electricity.shape for a in (travel, waste, diet_code)):
+        raise ValueError("electricity, travel, waste and diet_code must be 1-D arrays of the same length")
+    if diet_code.size and (diet_code.min() < 0 or diet_code.max() >= DIET_EXTRA.shape[0]):
+        raise ValueError(f"diet_code values must be in [0, {DIET_EXTRA.shape[0]})")
+
+    kernel = _emissions_kernel()
+    if kernel is not None:
+        return kernel(electricity, travel, waste, diet_code, DIET_EXTRA)
+    return (
+        electricity * ELECTRICITY_FACTOR
+        + travel * TRAVEL_FACTOR
+        + waste * WASTE_FACTOR
+        + DIET_EXTRA[diet_code]
+    )
+
+
+def warm_up():
+    """Compile (or load from the on-disk cache) the kernel ahead of the first real call."""
+    zeros = np.zeros(1)
+    compute_emissions_batch(zeros, zeros, zeros, np.zeros(1, dtype=np.int64))
@@ -1,11 +1,24 @@
+import json
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import streamlit as st
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from forecasting import ELECTRICITY_FACTOR, TRAVEL_FACTOR, WASTE_FACTOR, diet_extra_kg, warm_up
+
+try:
+    import orjson  # optional: faster JSON for Gemini requests and replies
+except ImportError:
+    orjson = None
 
 # ------------ LOAD ENV ------------ #
 load_dotenv()
@@ -15,12 +28,137 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # IMPORTANT: use a model that your key supports.
 GEMINI_MODEL = "gemini-2.5-flash"
-GEMINI_URL = f"https://generativelanguage.googleapis.com/v1/models/{GEMINI_MODEL}:generateContent"
+GEMINI_URL = f"https://generativelanguage.googleapis.com/v1/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse"
+# Batch mode is only offered on v1beta; jobs are answered asynchronously at batch pricing.
+GEMINI_BATCH_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:batchGenerateContent"
+GEMINI_BATCH_STATUS_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+# Kept short on purpose: every prompt token is billed and delays the first reply token
+GEMINI_SYSTEM_PROMPT = (
+    "Friendly sustainability assistant for Indian users. "
+    "Reply in 2–3 short sentences; add bullets if useful. Q: "
+)
+GEMINI_MAX_QUESTION_CHARS = 400
+GEMINI_GENERATION_CONFIG = {
+    "maxOutputTokens": 200,
+    "temperature": 0.3,
+    # 2.5 models count thinking tokens against maxOutputTokens; short tips don't need it
+    "thinkingConfig": {"thinkingBudget": 0},
+}
+
+# Streamed deltas longer than this are typed out STREAM_PACE_CHARS at a time
+STREAM_PACE_THRESHOLD = 50
+STREAM_PACE_CHARS = 4
+STREAM_PACE_SECONDS = 0.02
+# Total pacing budget per reply; after it, deltas are drawn as soon as they arrive
+STREAM_PACE_MAX_SECONDS = 0.5
+
+# ---------- SMTP CONFIG (Gmail app password) ----------
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 587
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_KEEPALIVE_SECONDS = 30
+SMTP_NOT_CONFIGURED = "Email is not configured on server (set SMTP_USER and SMTP_PASS in .env)."
+
+
+@st.cache_resource(show_spinner=False)
+def _log_config_status():
+    # Streamlit re-executes this file on every interaction; report once per process
+    if not GEMINI_API_KEY:
+        print("❌ GEMINI_API_KEY not found in .env")
+    else:
+        print("✅ GEMINI_API_KEY loaded")
+
+    if not (SMTP_USER and SMTP_PASS):
+        print("❌ SMTP_USER / SMTP_PASS not found in .env")
+    else:
+        print("✅ SMTP credentials loaded")
+
+
+_log_config_status()
+
+
+@st.cache_resource(show_spinner=False)
+def _start_forecasting_warm_up():
+    # Compile the batch emission kernel off the UI thread, once per process
+    threading.Thread(target=warm_up, name="forecasting-warm-up", daemon=True).start()
+
+
+_start_forecasting_warm_up()
+
+
+# ---------- USAGE LEVELS (bisect_left over the bins: value > bin moves up a level) ----------
+_ELEC_BINS = (100, 250)
+_ELEC_LEVELS = ("relatively low 👍.", "moderate level.", "this is on the higher side.")
+_WASTE_BINS = (10, 30)
+_WASTE_LEVELS = ("relatively low 👍.", "moderate level.", "there is strong scope to reduce this.")
+
+
+# ---------- EMAIL TIPS (constant, shared by every report) ----------
+_ENERGY_TIPS_BASE = (
+    "Replace old tube lights/CFLs with LED bulbs in frequently used rooms.",
+    "Turn off fans, lights and ACs whenever you leave the room.",
+    "Use natural daylight and cross-ventilation to reduce the need for lights and AC.",
+)
+_ENERGY_TIPS_HIGH_ELEC = (
+    "Set AC at 24–26°C and keep doors/windows closed while it runs.",
+    "Use washing machine only with full loads and eco/quick wash modes.",
+)
+_ENERGY_TIPS_LOW_RENEW = (
+    "Explore rooftop solar or green power options in your area (if available).",
+)
+
+_TRANSPORT_TIPS_PRIVATE = (
+    "Use public transport, metro or shared cabs for regular routes when possible.",
+    "Carpool with colleagues/friends to reduce solo trips.",
+    "Plan errands to combine multiple small trips into one journey.",
+    "Keep tyres properly inflated and service your vehicle regularly for better mileage.",
+)
+_TRANSPORT_TIPS_OTHER = (
+    "Continue choosing public transport or non-motorised options whenever possible.",
+)
+_TRANSPORT_TIPS_COMMON = (
+    "For very short distances, prefer walking or cycling instead of using a vehicle.",
+)
+
+_DIET_TIPS_MEAT = (
+    "Try 2–3 fully vegetarian days per week to gradually lower your food emissions.",
+    "Reduce red meat (mutton/beef) and prefer pulses, paneer, eggs or chicken instead.",
+)
+_DIET_TIPS_COMMON = (
+    "Prefer seasonal, locally grown fruits and vegetables over heavily packaged or imported options.",
+    "Plan meals and store leftovers properly to avoid food waste.",
+)
 
-if not GEMINI_API_KEY:
-    print("❌ GEMINI_API_KEY not found in .env")
-else:
-    print("✅ GEMINI_API_KEY loaded")
+_WASTE_TIPS = (
+    "Segregate waste at source: wet (organic), dry (recyclable) and reject waste.",
+    "Compost kitchen waste such as peels, leftover food and tea powder.",
+    "Avoid single-use plastics (bags, cutlery, straws); carry your own bottle and cloth bag.",
+    "Repair, reuse or donate usable items instead of throwing them away quickly.",
+)
+
+
+# ---------- EMAIL TEXT (constant intro, section headers and closing) ----------
+# Each entry is one item of the body's line list, so a leading "\n" is a blank line.
+_EMAIL_INTRO = (
+    "\n"
+    "Thank you for using the Carbon Emission Measurement tool. 🌍\n"
+    "Here is your personalised monthly carbon footprint report:"
+)
+_EMAIL_BREAKDOWN_INTRO = "\nBelow is a breakdown by category with suggestions tailored to your inputs:"
+_SECTION_HEADER_ENERGY = "\n1️⃣ Home Energy Use"
+_SECTION_HEADER_TRANSPORT = "\n2️⃣ Transport & Travel"
+_SECTION_HEADER_DIET = "\n3️⃣ Food & Diet"
+_SECTION_HEADER_WASTE = "\n4️⃣ Waste & Lifestyle"
+_EMAIL_CLOSING = (
+    "\n"
+    "You don’t need to change everything at once.\n"
+    "Pick 2–3 actions from any section and try them this month. Small, consistent steps lead to big impact over time. 🌱\n"
+    "\n"
+    "Regards,\n"
+    "Sustainability Assistant"
+)
 
 
 # ---------- HELPER: build personalised email body (SAME AS YOUR FLASK CODE) ----------
@@ -41,51 +179,33 @@ def build_personalised_body(name, emission_value, inputs):
 
     per_capita = emission_value / max(household, 1)
 
-    lines = []
-
     # Intro + summary
-    lines.append(f"Hi {name},")
-    lines.append("")
-    lines.append("Thank you for using the Carbon Emission Measurement tool. 🌍")
-    lines.append("Here is your personalised monthly carbon footprint report:")
+    lines = [f"Hi {name},", _EMAIL_INTRO]
     lines.append(f"→ Estimated total footprint: {emission_value:.2f} kg CO₂e / month")
     lines.append(f"→ Approx. per-person footprint: {per_capita:.2f} kg CO₂e (household size: {household})")
-    lines.append("")
-    lines.append("Below is a breakdown by category with suggestions tailored to your inputs:")
+    lines.append(_EMAIL_BREAKDOWN_INTRO)
 
     # 1) Energy
-    lines.append("")
-    lines.append("1️⃣ Home Energy Use")
+    lines.append(_SECTION_HEADER_ENERGY)
 
-    if electricity > 250:
-        lines.append(f"- Electricity use: {electricity:.0f} kWh/month — this is on the higher side.")
-    elif electricity > 100:
-        lines.append(f"- Electricity use: {electricity:.0f} kWh/month — moderate level.")
-    else:
-        lines.append(f"- Electricity use: {electricity:.0f} kWh/month — relatively low 👍.")
+    level = _ELEC_LEVELS[bisect_left(_ELEC_BINS, electricity)]
+    lines.append(f"- Electricity use: {electricity:.0f} kWh/month — {level}")
 
     lines.append(f"- Reported electricity source: {electricity_source.capitalize()}, about {renewable:.0f}% from renewables.")
     if lpg > 0:
         lines.append(f"- LPG / cooking gas usage: {lpg:.1f} kg per month.")
 
-    energy_tips = [
-        "Replace old tube lights/CFLs with LED bulbs in frequently used rooms.",
-        "Turn off fans, lights and ACs whenever you leave the room.",
-        "Use natural daylight and cross-ventilation to reduce the need for lights and AC.",
-    ]
+    energy_tips = _ENERGY_TIPS_BASE
     if electricity > 200:
-        energy_tips.append("Set AC at 24–26°C and keep doors/windows closed while it runs.")
-        energy_tips.append("Use washing machine only with full loads and eco/quick wash modes.")
+        energy_tips += _ENERGY_TIPS_HIGH_ELEC
     if renewable < 40:
-        energy_tips.append("Explore rooftop solar or green power options in your area (if available).")
+        energy_tips += _ENERGY_TIPS_LOW_RENEW
 
     lines.append("Recommended actions for energy:")
-    for tip in energy_tips:
-        lines.append(f"• {tip}")
+    lines.append("• " + "\n• ".join(energy_tips))
 
     # 2) Transport
-    lines.append("")
-    lines.append("2️⃣ Transport & Travel")
+    lines.append(_SECTION_HEADER_TRANSPORT)
 
     if vehicle_type in ["car", "bike"] and travel > 200:
         lines.append(f"- You travel about {travel:.0f} km/month using a {vehicle_type}, mostly private transport.")
@@ -100,23 +220,16 @@ def build_personalised_body(name, emission_value, inputs):
     if efficiency > 0 and vehicle_type in ["car", "bike"]:
         lines.append(f"- Vehicle efficiency: ~{efficiency:.1f} km per litre/kWh.")
 
-    transport_tips = []
     if vehicle_type in ["car", "bike"]:
-        transport_tips.append("Use public transport, metro or shared cabs for regular routes when possible.")
-        transport_tips.append("Carpool with colleagues/friends to reduce solo trips.")
-        transport_tips.append("Plan errands to combine multiple small trips into one journey.")
-        transport_tips.append("Keep tyres properly inflated and service your vehicle regularly for better mileage.")
+        transport_tips = _TRANSPORT_TIPS_PRIVATE + _TRANSPORT_TIPS_COMMON
     else:
-        transport_tips.append("Continue choosing public transport or non-motorised options whenever possible.")
-    transport_tips.append("For very short distances, prefer walking or cycling instead of using a vehicle.")
+        transport_tips = _TRANSPORT_TIPS_OTHER + _TRANSPORT_TIPS_COMMON
 
     lines.append("Recommended actions for transport:")
-    for tip in transport_tips:
-        lines.append(f"• {tip}")
+    lines.append("• " + "\n• ".join(transport_tips))
 
     # 3) Diet
-    lines.append("")
-    lines.append("3️⃣ Food & Diet")
+    lines.append(_SECTION_HEADER_DIET)
 
     if diet == "veg":
         lines.append("- You follow a vegetarian diet, which is generally lower in emissions compared to heavy meat diets. 🌱")
@@ -127,54 +240,106 @@ def build_personalised_body(name, emission_value, inputs):
     else:
         lines.append("- You reported a mixed diet (some vegetarian and some non-vegetarian meals).")
 
-    diet_tips = []
     if diet in ["nonveg", "mixed"]:
-        diet_tips.append("Try 2–3 fully vegetarian days per week to gradually lower your food emissions.")
-        diet_tips.append("Reduce red meat (mutton/beef) and prefer pulses, paneer, eggs or chicken instead.")
-    diet_tips.append("Prefer seasonal, locally grown fruits and vegetables over heavily packaged or imported options.")
-    diet_tips.append("Plan meals and store leftovers properly to avoid food waste.")
+        diet_tips = _DIET_TIPS_MEAT + _DIET_TIPS_COMMON
+    else:
+        diet_tips = _DIET_TIPS_COMMON
 
     lines.append("Recommended actions for food:")
-    for tip in diet_tips:
-        lines.append(f"• {tip}")
+    lines.append("• " + "\n• ".join(diet_tips))
 
     # 4) Waste
-    lines.append("")
-    lines.append("4️⃣ Waste & Lifestyle")
+    lines.append(_SECTION_HEADER_WASTE)
 
-    if waste > 30:
-        lines.append(f"- You generate about {waste:.0f} kg of waste per month — there is strong scope to reduce this.")
-    elif waste > 10:
-        lines.append(f"- You generate about {waste:.0f} kg of waste per month — moderate level.")
-    else:
-        lines.append(f"- You generate about {waste:.0f} kg of waste per month — relatively low 👍.")
-
-    waste_tips = [
-        "Segregate waste at source: wet (organic), dry (recyclable) and reject waste.",
-        "Compost kitchen waste such as peels, leftover food and tea powder.",
-        "Avoid single-use plastics (bags, cutlery, straws); carry your own bottle and cloth bag.",
-        "Repair, reuse or donate usable items instead of throwing them away quickly.",
-    ]
+    level = _WASTE_LEVELS[bisect_left(_WASTE_BINS, waste)]
+    lines.append(f"- You generate about {waste:.0f} kg of waste per month — {level}")
 
     lines.append("Recommended actions for waste & lifestyle:")
-    for tip in waste_tips:
-        lines.append(f"• {tip}")
+    lines.append("• " + "\n• ".join(_WASTE_TIPS))
 
     # Closing
-    lines.append("")
-    lines.append("You don’t need to change everything at once.")
-    lines.append("Pick 2–3 actions from any section and try them this month. Small, consistent steps lead to big impact over time. 🌱")
-    lines.append("")
-    lines.append("Regards,")
-    lines.append("Sustainability Assistant")
+    lines.append(_EMAIL_CLOSING)
 
     return "\n".join(lines)
 
 
+# ---------- SMTP CONNECTION (logged in once, reused for every email) ----------
+class SMTPConnectionPool:
+    """A single authenticated SMTP connection shared by all sends, kept alive with NOOP."""
+
+    def __init__(self, host, port, user, password, keepalive_seconds=30):
+        self._host = host
+        self._port = port
+        self._user = user
+        self._password = password
+        self._keepalive_seconds = keepalive_seconds
+        self._server = None
+        self._lock = threading.Lock()
+        threading.Thread(target=self._keepalive, name="smtp-keepalive", daemon=True).start()
+
+    def _connect(self):
+        import smtplib
+
+        server = smtplib.SMTP(self._host, self._port, timeout=30)
+        server.starttls()
+        server.login(self._user, self._password)
+        return server
+
+    def _drop(self):
+        server, self._server = self._server, None
+        try:
+            server.close()
+        except Exception:
+            pass
+
+    def send_message(self, msg):
+        import smtplib
+
+        with self._lock:
+            if self._server is None:
+                self._server = self._connect()
+            try:
+                self._server.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # The server closed the idle session; log in again and retry once
+                self._drop()
+                self._server = self._connect()
+                self._server.send_message(msg)
+
+    def _keepalive(self):
+        while True:
+            time.sleep(self._keepalive_seconds)
+            with self._lock:
+                if self._server is None:
+                    continue
+                try:
+                    self._server.noop()
+                except Exception:
+                    self._drop()
+
+
+@st.cache_resource(show_spinner=False)
+def _smtp_pool() -> SMTPConnectionPool:
+    return SMTPConnectionPool(SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_KEEPALIVE_SECONDS)
+
+
+def _make_msg(to_email, subject, body):
+    # Only the email path needs this; keep it off the per-rerun import block
+    from email.message import EmailMessage
+
+    # A single-part plain-text message; no multipart wrapper is needed
+    msg = EmailMessage()
+    msg["From"] = SMTP_USER
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.set_content(body)
+    return msg
+
+
 # ---------- EMAIL FUNCTION (SAME BEHAVIOUR AS YOUR FLASK) ----------
 def send_recommendation_email(to_email, name, emission_value, inputs=None, suggestions=None):
-    sender_email = "vanshikaaaaaa04@gmail.com"
-    sender_password = "wvapoaojkoqtpnev"  # move to .env for real deployment
+    if not (SMTP_USER and SMTP_PASS):
+        return False, SMTP_NOT_CONFIGURED
 
     # If we got detailed inputs, build full personalised body
     if inputs:
@@ -201,66 +366,426 @@ Regards,
 Sustainability Assistant
 """
 
-    msg = MIMEMultipart()
-    msg["From"] = sender_email
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
+    msg = _make_msg(to_email, subject, body)
 
     try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-            print("✅ Email sent successfully!")
-            return True, "Email sent successfully!"
+        _smtp_pool().send_message(msg)
+        print("✅ Email sent successfully!")
+        return True, "Email sent successfully!"
     except Exception as e:
         print("❌ Error sending email:", e)
         return False, f"Error sending email: {e}"
 
 
+@st.cache_resource(show_spinner=False)
+def _email_executor() -> ThreadPoolExecutor:
+    # SMTP is pure network wait; sending on a worker thread keeps the
+    # Calculate button from blocking until Gmail answers.
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="email")
+
+
+@st.fragment(run_every=1)
+def _email_status_poller():
+    # Reruns on its own every second, so a send's result shows up as soon as
+    # it finishes instead of waiting for the next full-page rerun.
+    futures = st.session_state.get("email_futures", [])
+    results = []
+    for future in [f for f in futures if f.done()]:
+        futures.remove(future)
+        results.append(future.result())
+    if futures:
+        for ok, msg in results:
+            st.toast(msg, icon="✅" if ok else "❌")
+    elif results:
+        # run_every keeps firing until the next full run, so hand the last results
+        # to that run and trigger it now; it won't render the poller again.
+        st.session_state["email_results"] = results
+        st.rerun()
+
+
 # ---------- GEMINI CHAT CALL (MATCHES YOUR /chat ENDPOINT PROMPT) ----------
-def call_gemini(user_message: str) -> str:
-    if not GEMINI_API_KEY:
-        return "Gemini API key not configured on server."
+@st.cache_resource(show_spinner=False)
+def _gemini_session() -> requests.Session:
+    # One pooled keep-alive session per server process, so chat messages after
+    # the first reuse the TLS connection instead of handshaking again.
+    retry = Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+    return session
 
-    payload = {
+
+_EMAIL_ADDRESS_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_NUMBER_RE = re.compile(r"(?:\+91[\s-]?|\b0|\b)[6-9]\d{4}[\s-]?\d{5}\b")
+
+
+def _prepare_message(user_message: str) -> str:
+    # The text actually sent to Gemini, in its original case (LED, CO2, place names).
+    # Contact details are never needed to answer, so they aren't sent to Gemini,
+    # and rambling questions are capped to keep the prompt short.
+    message = _EMAIL_ADDRESS_RE.sub("[email]", user_message)
+    message = _PHONE_NUMBER_RE.sub("[phone]", message)
+    message = re.sub(r"\s+", " ", message.strip())
+    if len(message) > GEMINI_MAX_QUESTION_CHARS:
+        message = message[:GEMINI_MAX_QUESTION_CHARS].rstrip() + "…"
+    return message
+
+
+def _cache_key(message: str) -> str:
+    # "Save Energy?" and "  save   energy? " should share one cache entry
+    return message.lower()
+
+
+class GeminiError(Exception):
+    """Raised for failed Gemini calls so the error text is never cached."""
+
+
+class GeminiBatchFailed(GeminiError):
+    """Raised when Gemini reports the batch job itself as failed; it can't be collected again."""
+
+
+class _ReplyCache:
+    """Thread-safe LRU of finished replies with a time-to-live, shared by all sessions."""
+
+    def __init__(self, maxsize=512, ttl=86400):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            stored_at, reply = item
+            if time.monotonic() - stored_at > self._ttl:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return reply
+
+    def put(self, key, reply):
+        with self._lock:
+            self._items[key] = (time.monotonic(), reply)
+            self._items.move_to_end(key)
+            while len(self._items) > self._maxsize:
+                self._items.popitem(last=False)
+
+
+@st.cache_resource(show_spinner=False)
+def _gemini_reply_cache() -> _ReplyCache:
+    # st.cache_data can't hold a reply that is still streaming, so finished
+    # replies go into this process-wide LRU instead.
+    return _ReplyCache(maxsize=512, ttl=86400)
+
+
+def _gemini_payload(message: str) -> dict:
+    return {
         "contents": [
             {
                 "parts": [
                     {
-                        "text": (
-                            "You are a friendly sustainability assistant for an "
-                            "Answer in 2–3 short sentences and more points if required, make it use friendly: "
-                            + user_message
-                        )
+                        "text": GEMINI_SYSTEM_PROMPT + message
                     }
                 ]
             }
-        ]
+        ],
+        "generationConfig": GEMINI_GENERATION_CONFIG,
     }
 
-    headers = {
-        "Content-Type": "application/json",
-        "x-goog-api-key": GEMINI_API_KEY,
-    }
+
+_GEMINI_HEADERS = {
+    "Content-Type": "application/json",
+    "x-goog-api-key": GEMINI_API_KEY,
+}
+
+
+def _json_dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode("utf-8")
+
+
+def _json_loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _stream_gemini_deltas(message: str):
+    # Yields (text delta, finishReason) per event; finishReason is None until the last one
+    payload = _gemini_payload(message)
 
     try:
-        resp = requests.post(GEMINI_URL, headers=headers, json=payload, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-        reply = "Sorry, I couldn't generate a reply."
-        try:
-            reply = data["candidates"][0]["content"]["parts"][0].get("text", reply)
-        except (KeyError, IndexError, TypeError):
-            print("⚠️ Unexpected Gemini response format:", data)
-        return reply
+        with _gemini_session().post(GEMINI_URL, headers=_GEMINI_HEADERS, data=_json_dumps(payload), timeout=60, stream=True) as resp:
+            resp.raise_for_status()
+            # Server-sent events: one "data: {...}" line per partial response
+            for line in resp.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                event = _json_loads(line[5:])
+                try:
+                    candidate = event["candidates"][0]
+                except (KeyError, IndexError, TypeError):
+                    # e.g. a trailing event that only carries usage metadata
+                    continue
+                parts = candidate.get("content", {}).get("parts", [])
+                delta = "".join(part.get("text", "") for part in parts)
+                yield delta, candidate.get("finishReason")
     except requests.exceptions.HTTPError as e:
         print("❌ Gemini HTTP error:", e.response.text)
-        return f"Gemini HTTP error: {e.response.text}"
+        raise GeminiError(f"Gemini HTTP error: {e.response.text}") from e
     except Exception as e:
         print("❌ Gemini request error:", repr(e))
-        return f"Gemini request error: {e}"
+        raise GeminiError(f"Gemini request error: {e}") from e
+
+
+def _paced(delta: str, deadline: float):
+    # Big deltas are re-chunked into small pieces so the reply types out
+    # smoothly instead of landing in one block, but only until the reply's
+    # pacing budget runs out, so a long reply never finishes later than unpaced.
+    if len(delta) <= STREAM_PACE_THRESHOLD:
+        yield delta
+        return
+    for i in range(0, len(delta), STREAM_PACE_CHARS):
+        if time.monotonic() >= deadline:
+            yield delta[i:]
+            return
+        yield delta[i:i + STREAM_PACE_CHARS]
+        time.sleep(STREAM_PACE_SECONDS)
+
+
+def stream_gemini(user_message: str):
+    """Yield the chatbot reply piece by piece; cached replies arrive in one piece."""
+    if not GEMINI_API_KEY:
+        yield "Gemini API key not configured on server."
+        return
+
+    message = _prepare_message(user_message)
+    key = _cache_key(message)
+    cache = _gemini_reply_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    # Only complete replies are cached; a failed, empty or cut-off (MAX_TOKENS,
+    # SAFETY, ...) stream is retried on the next question rather than cached.
+    received = []
+    finish_reason = None
+    pace_deadline = time.monotonic() + STREAM_PACE_MAX_SECONDS
+    try:
+        for delta, reason in _stream_gemini_deltas(message):
+            finish_reason = reason or finish_reason
+            if delta:
+                received.append(delta)
+                yield from _paced(delta, pace_deadline)
+    except GeminiError as e:
+        yield f"\n\n{e}" if received else str(e)
+        return
+
+    if not received:
+        print("⚠️ Gemini stream ended without any text")
+        yield "Sorry, I couldn't generate a reply."
+        return
+    if finish_reason == "STOP":
+        cache.put(key, "".join(received))
+
+
+# ---------- GEMINI BATCH MODE (queued questions, answered asynchronously) ----------
+def submit_gemini_batch(questions) -> str:
+    """Submit the queued questions as one Gemini batch job and return the job name."""
+    if not GEMINI_API_KEY:
+        raise GeminiError("Gemini API key not configured on server.")
+
+    batch_requests = [
+        {"request": _gemini_payload(_prepare_message(q)), "metadata": {"key": str(i)}}
+        for i, q in enumerate(questions)
+    ]
+    payload = {
+        "batch": {
+            "display_name": "sustainability-chatbot",
+            "input_config": {"requests": {"requests": batch_requests}},
+        }
+    }
+
+    try:
+        # Not through the pooled session: its Retry re-sends POSTs on 429/5xx, and
+        # creating a batch job isn't idempotent, so a retry could bill a duplicate job.
+        resp = requests.post(GEMINI_BATCH_URL, headers=_GEMINI_HEADERS, data=_json_dumps(payload), timeout=60)
+        resp.raise_for_status()
+        return _json_loads(resp.content)["name"]
+    except requests.exceptions.HTTPError as e:
+        print("❌ Gemini batch HTTP error:", e.response.text)
+        raise GeminiError(f"Gemini HTTP error: {e.response.text}") from e
+    except Exception as e:
+        print("❌ Gemini batch request error:", repr(e))
+        raise GeminiError(f"Gemini request error: {e}") from e
+
+
+def fetch_gemini_batch(job_name: str, questions):
+    """Return the replies of a finished batch job in question order, or None while it is still running."""
+    try:
+        resp = _gemini_session().get(f"{GEMINI_BATCH_STATUS_URL}/{job_name}", headers=_GEMINI_HEADERS, timeout=60)
+        resp.raise_for_status()
+        data = _json_loads(resp.content)
+    except requests.exceptions.HTTPError as e:
+        print("❌ Gemini batch HTTP error:", e.response.text)
+        raise GeminiError(f"Gemini HTTP error: {e.response.text}") from e
+    except Exception as e:
+        print("❌ Gemini batch request error:", repr(e))
+        raise GeminiError(f"Gemini request error: {e}") from e
+
+    if not data.get("done"):
+        return None
+    if "error" in data:
+        print("❌ Gemini batch failed:", data["error"])
+        raise GeminiBatchFailed(f"Gemini batch failed: {data['error'].get('message', data['error'])}")
+
+    inlined = data.get("response", {}).get("inlinedResponses", [])
+    if isinstance(inlined, dict):
+        inlined = inlined.get("inlinedResponses", [])
+
+    replies = ["Sorry, I couldn't generate a reply."] * len(questions)
+    cache = _gemini_reply_cache()
+    for position, item in enumerate(inlined):
+        index = int(item.get("metadata", {}).get("key", position))
+        try:
+            candidate = item["response"]["candidates"][0]
+            parts = candidate["content"]["parts"]
+        except (KeyError, IndexError, TypeError):
+            print("⚠️ Unexpected Gemini batch item:", item)
+            continue
+        reply = "".join(part.get("text", "") for part in parts)
+        if not reply or not 0 <= index < len(questions):
+            continue
+        replies[index] = reply
+        if candidate.get("finishReason") == "STOP":
+            cache.put(_cache_key(_prepare_message(questions[index])), reply)
+    return replies
+
+
+# ---------- SUGGESTION TABLES (same thresholds as JS; None = no suggestion) ----------
+_ELEC_SUGGESTIONS = (
+    None,
+    "Focus on home energy efficiency: use LED bulbs, switch off fans/lights when you leave the room, "
+    "and run washing machines only with full loads.",
+    "Your electricity use is quite high. Shift fully to LED bulbs, keep AC at 24–26°C, "
+    "and unplug chargers/devices when not in use to reduce demand.",
+)
+_PRIVATE_TRAVEL_BINS = (100, 300)
+_PRIVATE_TRAVEL_SUGGESTIONS = (
+    None,
+    "Replace some short private vehicle trips with walking, cycling, or public transport to cut fuel use and emissions.",
+    "Your private vehicle travel is a major source of emissions. Try carpooling, using public transport, "
+    "and combining errands so you drive fewer kilometres.",
+)
+_WASTE_SUGGESTION_BINS = (15, 30)
+_WASTE_SUGGESTIONS = (
+    None,
+    "Work on reducing waste by buying only what you need, reusing containers, and saying no to single-use plastics.",
+    "You generate quite a lot of waste. Start segregating at source, compost kitchen scraps, "
+    "and cut down on single-use plastics.",
+)
+
+
+# ---------- EMISSION MODEL (same as JS) ----------
+@st.cache_data(max_entries=256, show_spinner=False)
+def compute_footprint(electricity, vehicle_type, travel, diet, waste, renewable):
+    """Monthly emissions by category plus the top-3 suggestions for these inputs."""
+    energy_emission = electricity * ELECTRICITY_FACTOR
+    transport_emission = travel * TRAVEL_FACTOR
+    waste_emission = waste * WASTE_FACTOR
+    diet_extra = diet_extra_kg(diet)
+
+    emission_value = energy_emission + transport_emission + waste_emission + diet_extra
+
+    # Build suggestions (same logic style as JS)
+    suggestions = []
+
+    # Energy-related
+    energy_tip = _ELEC_SUGGESTIONS[bisect_left(_ELEC_BINS, electricity)]
+    if energy_tip:
+        suggestions.append(energy_tip)
+
+    # Transport-related
+    if vehicle_type in ["car", "bike"]:
+        travel_tip = _PRIVATE_TRAVEL_SUGGESTIONS[bisect_left(_PRIVATE_TRAVEL_BINS, travel)]
+        if travel_tip:
+            suggestions.append(travel_tip)
+    elif vehicle_type in ["bus", "train"]:
+        suggestions.append(
+            "You already use public transport. Keep it up, and consider walking or cycling for very short distances."
+        )
+
+    # Diet-related
+    if diet in ["nonveg", "mixed"]:
+        suggestions.append(
+            "Your diet includes animal products. Reduce red meat and add more plant-based meals 2–3 days a week "
+            "to lower food-related emissions."
+        )
+    elif diet in ["veg", "vegan"]:
+        suggestions.append(
+            "Your diet is already climate-friendly. Continue focusing on seasonal, local foods and avoid food waste."
+        )
+
+    # Waste-related
+    waste_tip = _WASTE_SUGGESTIONS[bisect_left(_WASTE_SUGGESTION_BINS, waste)]
+    if waste_tip:
+        suggestions.append(waste_tip)
+
+    # Renewable share
+    if renewable < 20:
+        suggestions.append(
+            "Increase your share of renewable energy over time — explore rooftop solar or green power options if they are available in your area."
+        )
+
+    # Ensure at least 3 suggestions
+    generic = [
+        "Carry your own water bottle and cloth bag to avoid single-use plastics.",
+        "Plant native trees or support local tree-planting drives.",
+        "Review one habit each week (energy, travel, food, or waste) and try a small improvement.",
+    ]
+    for g in generic:
+        if len(suggestions) >= 3:
+            break
+        suggestions.append(g)
+
+    return {
+        "energy_emission": energy_emission,
+        "transport_emission": transport_emission,
+        "waste_emission": waste_emission,
+        "diet_extra": diet_extra,
+        "emission_value": emission_value,
+        "suggestions": suggestions[:3],
+    }
+
+
+def breakdown_chart_spec(energy_emission, transport_emission, waste_emission, diet_extra) -> dict:
+    """Hand-written Vega-Lite bar chart of the emission breakdown (fixed bar order, axis titles)."""
+    # Streamlit still turns the inline values into a DataFrame and Arrow bytes on
+    # every render; the four-row table is too small for caching it to matter.
+    return {
+        "data": {
+            "values": [
+                {"category": "Energy", "kg": energy_emission},
+                {"category": "Transport", "kg": transport_emission},
+                {"category": "Waste", "kg": waste_emission},
+                {"category": "Diet extra", "kg": diet_extra},
+            ]
+        },
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": "category", "type": "nominal", "sort": None, "title": None},
+            "y": {"field": "kg", "type": "quantitative", "title": "kg CO₂e / month"},
+        },
+    }
 
 
 # ----------------- STREAMLIT UI ----------------- #
@@ -328,111 +853,44 @@ with tab_calc:
     st.header("Carbon Footprint Calculator")
     st.caption("Enter your monthly details — the calculator will estimate your total carbon emissions for one month.")
 
-    email = st.text_input("Email address (to receive personalized report)")
-    name = st.text_input("Your name (optional)", value="User")
-
-    st.markdown("### Energy")
-    electricity = st.number_input("Electricity usage (kWh/month)", min_value=0.0, value=150.0, step=10.0)
-    electricity_source = st.selectbox("Source of electricity", ["coal", "renewable", "mixed"])
-    lpg = st.number_input("LPG / natural gas usage (kg/month)", min_value=0.0, value=10.0, step=1.0)
-
-    st.markdown("### Transport")
-    vehicle_type = st.selectbox("Vehicle type", ["car", "bike", "bus", "train", "none"])
-    travel = st.number_input("Distance travelled (km/month)", min_value=0.0, value=300.0, step=10.0)
-    efficiency = st.number_input("Vehicle fuel efficiency (km/litre or km/kWh)", min_value=0.0, value=15.0, step=1.0)
-
-    st.markdown("### Food & Waste")
-    diet = st.selectbox("Diet type", ["veg", "nonveg", "vegan", "mixed"])
-    waste = st.number_input("Waste generated (kg/month)", min_value=0.0, value=20.0, step=1.0)
-
-    st.markdown("### Household & Renewables")
-    household = st.number_input("Number of people in household", min_value=1, value=4, step=1)
-    renewable = st.number_input("Renewable energy usage (%)", min_value=0.0, max_value=100.0, value=30.0, step=5.0)
-
-    if st.button("Calculate Monthly Emissions"):
-        # Same emission model as JS
-        energy_emission = electricity * 0.8
-        transport_emission = travel * 0.12
-        waste_emission = waste * 0.4
-        diet_extra = 0
-        if diet == "mixed":
-            diet_extra = 5
-        elif diet == "nonveg":
-            diet_extra = 10
-
-        emission_value = energy_emission + transport_emission + waste_emission + diet_extra
+    # Inputs only take effect on submit, so editing them doesn't rerun the calculation
+    with st.form("calc_form"):
+        email = st.text_input("Email address (to receive personalized report)")
+        name = st.text_input("Your name (optional)", value="User")
+
+        st.markdown("### Energy")
+        electricity = st.number_input("Electricity usage (kWh/month)", min_value=0.0, value=150.0, step=10.0)
+        electricity_source = st.selectbox("Source of electricity", ["coal", "renewable", "mixed"])
+        lpg = st.number_input("LPG / natural gas usage (kg/month)", min_value=0.0, value=10.0, step=1.0)
+
+        st.markdown("### Transport")
+        vehicle_type = st.selectbox("Vehicle type", ["car", "bike", "bus", "train", "none"])
+        travel = st.number_input("Distance travelled (km/month)", min_value=0.0, value=300.0, step=10.0)
+        efficiency = st.number_input("Vehicle fuel efficiency (km/litre or km/kWh)", min_value=0.0, value=15.0, step=1.0)
+
+        st.markdown("### Food & Waste")
+        diet = st.selectbox("Diet type", ["veg", "nonveg", "vegan", "mixed"])
+        waste = st.number_input("Waste generated (kg/month)", min_value=0.0, value=20.0, step=1.0)
+
+        st.markdown("### Household & Renewables")
+        household = st.number_input("Number of people in household", min_value=1, value=4, step=1)
+        renewable = st.number_input("Renewable energy usage (%)", min_value=0.0, max_value=100.0, value=30.0, step=5.0)
+
+        submitted = st.form_submit_button("Calculate Monthly Emissions")
+
+    if submitted:
+        st.session_state["footprint"] = compute_footprint(electricity, vehicle_type, travel, diet, waste, renewable)
+
+    # Kept in session_state so the results survive the rerun that stops the email poller
+    if "footprint" in st.session_state:
+        footprint = st.session_state["footprint"]
+        energy_emission = footprint["energy_emission"]
+        transport_emission = footprint["transport_emission"]
+        waste_emission = footprint["waste_emission"]
+        diet_extra = footprint["diet_extra"]
+        emission_value = footprint["emission_value"]
+        email_suggestions = footprint["suggestions"]
         st.success(f"Estimated monthly emissions: **{emission_value:.2f} kg CO₂e**")
-
-        # Build suggestions (same logic style as JS)
-        suggestions = []
-
-        # Energy-related
-        if electricity > 250:
-            suggestions.append(
-                "Your electricity use is quite high. Shift fully to LED bulbs, keep AC at 24–26°C, "
-                "and unplug chargers/devices when not in use to reduce demand."
-            )
-        elif electricity > 100:
-            suggestions.append(
-                "Focus on home energy efficiency: use LED bulbs, switch off fans/lights when you leave the room, "
-                "and run washing machines only with full loads."
-            )
-
-        # Transport-related
-        if (vehicle_type in ["car", "bike"]) and travel > 300:
-            suggestions.append(
-                "Your private vehicle travel is a major source of emissions. Try carpooling, using public transport, "
-                "and combining errands so you drive fewer kilometres."
-            )
-        elif (vehicle_type in ["car", "bike"]) and travel > 100:
-            suggestions.append(
-                "Replace some short private vehicle trips with walking, cycling, or public transport to cut fuel use and emissions."
-            )
-        elif vehicle_type in ["bus", "train"]:
-            suggestions.append(
-                "You already use public transport. Keep it up, and consider walking or cycling for very short distances."
-            )
-
-        # Diet-related
-        if diet in ["nonveg", "mixed"]:
-            suggestions.append(
-                "Your diet includes animal products. Reduce red meat and add more plant-based meals 2–3 days a week "
-                "to lower food-related emissions."
-            )
-        elif diet in ["veg", "vegan"]:
-            suggestions.append(
-                "Your diet is already climate-friendly. Continue focusing on seasonal, local foods and avoid food waste."
-            )
-
-        # Waste-related
-        if waste > 30:
-            suggestions.append(
-                "You generate quite a lot of waste. Start segregating at source, compost kitchen scraps, "
-                "and cut down on single-use plastics."
-            )
-        elif waste > 15:
-            suggestions.append(
-                "Work on reducing waste by buying only what you need, reusing containers, and saying no to single-use plastics."
-            )
-
-        # Renewable share
-        if renewable < 20:
-            suggestions.append(
-                "Increase your share of renewable energy over time — explore rooftop solar or green power options if they are available in your area."
-            )
-
-        # Ensure at least 3 suggestions
-        generic = [
-            "Carry your own water bottle and cloth bag to avoid single-use plastics.",
-            "Plant native trees or support local tree-planting drives.",
-            "Review one habit each week (energy, travel, food, or waste) and try a small improvement.",
-        ]
-        for g in generic:
-            if len(suggestions) >= 3:
-                break
-            suggestions.append(g)
-
-        email_suggestions = suggestions[:3]
         top_suggestion = email_suggestions[0] if email_suggestions else \
             "Reduce electricity use or avoid short solo car trips."
 
@@ -444,13 +902,12 @@ with tab_calc:
 
         # Emission breakdown chart
         st.markdown("### Emission breakdown")
-        st.bar_chart({
-            "Energy": [energy_emission],
-            "Transport": [transport_emission],
-            "Waste": [waste_emission],
-            "Diet extra": [diet_extra],
-        })
+        st.vega_lite_chart(
+            spec=breakdown_chart_spec(energy_emission, transport_emission, waste_emission, diet_extra),
+            width="stretch",
+        )
 
+    if submitted:
         # Inputs dict for email (same as in JS → Flask)
         inputs = {
             "electricity": electricity,
@@ -465,32 +922,40 @@ with tab_calc:
             "renewable": renewable,
         }
 
-        if email:
-            ok, msg = send_recommendation_email(email, name or "User", emission_value, inputs, email_suggestions)
-            if ok:
-                st.success(msg)
-            else:
-                st.error(msg)
-        else:
+        if not email:
             st.info("Enter your email above if you want this personalised report in your inbox.")
+        elif not (SMTP_USER and SMTP_PASS):
+            st.error(SMTP_NOT_CONFIGURED)
+        else:
+            # A list, so a second submit while one send is pending doesn't lose its result
+            st.session_state.setdefault("email_futures", []).append(_email_executor().submit(
+                send_recommendation_email, email, name or "User", emission_value, inputs, email_suggestions
+            ))
+            st.info("Sending your personalised report in the background...")
+
+    for ok, msg in st.session_state.pop("email_results", []):
+        st.toast(msg, icon="✅" if ok else "❌")
+    if st.session_state.get("email_futures"):
+        _email_status_poller()
 
 # ---------- CHATBOT (Gemini, same prompt style as your Flask /chat) ----------
-with tab_chat:
+# Runs as a fragment: sending a message only reruns the chat, not the whole page
+@st.fragment
+def render_chat():
     st.header("Sustainability Chatbot")
     st.caption("Ask about saving energy, food emissions, recycling...")
 
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
+    if "batch_queue" not in st.session_state:
+        st.session_state.batch_queue = []
 
-    user_q = st.text_input("Type your question here:")
-
-    if st.button("Send"):
-        if user_q.strip():
-            reply = call_gemini(user_q.strip())
-            st.session_state.chat_history.append(("You", user_q.strip()))
-            st.session_state.chat_history.append(("Bot", reply))
-        else:
-            st.warning("Please type a question first.")
+    batch_mode = st.toggle(
+        "Batch mode",
+        help="Queue several questions and send them as one Gemini batch job. "
+             "Cheaper, but answers can take a while to arrive.",
+    )
+    user_q = st.chat_input("Type your question here:")
 
     for speaker, text in st.session_state.chat_history:
         if speaker == "You":
@@ -498,6 +963,65 @@ with tab_chat:
         else:
             st.markdown(f"**Bot:** {text}")
 
+    if user_q is not None:
+        if user_q.strip():
+            question = user_q.strip()
+            if batch_mode:
+                st.session_state.batch_queue.append(question)
+            else:
+                st.markdown(f"**You:** {question}")
+                placeholder = st.empty()
+                reply = ""
+                for piece in stream_gemini(question):
+                    reply += piece
+                    placeholder.markdown(f"**Bot:** {reply}")
+                st.session_state.chat_history.append(("You", question))
+                st.session_state.chat_history.append(("Bot", reply))
+        else:
+            st.warning("Please type a question first.")
+
+    queue = st.session_state.batch_queue
+    if batch_mode and queue:
+        st.markdown("**Queued questions:**")
+        for q in queue:
+            st.markdown(f"- {q}")
+        # One job at a time, so a pending (already billed) job is never orphaned
+        pending = "batch_job" in st.session_state
+        if st.button("Submit batch", disabled=pending,
+                     help="Wait for the pending batch to finish first." if pending else None):
+            try:
+                st.session_state.batch_job = (submit_gemini_batch(queue), list(queue))
+                queue.clear()
+                st.rerun(scope="fragment")
+            except GeminiError as e:
+                st.error(str(e))
+
+    if "batch_job" in st.session_state:
+        job_name, questions = st.session_state.batch_job
+        st.info(f"Batch of {len(questions)} question(s) submitted — check back for the answers.")
+        if st.button("Check batch results"):
+            try:
+                replies = fetch_gemini_batch(job_name, questions)
+            except GeminiBatchFailed as e:
+                del st.session_state.batch_job
+                st.error(str(e))
+            except GeminiError as e:
+                # Network trouble: keep the job so it can still be collected later
+                st.error(f"{e} — please try checking again.")
+            else:
+                if replies is None:
+                    st.info("The batch is still being processed. Please check again in a little while.")
+                else:
+                    for question, reply in zip(questions, replies):
+                        st.session_state.chat_history.append(("You", question))
+                        st.session_state.chat_history.append(("Bot", reply))
+                    del st.session_state.batch_job
+                    st.rerun(scope="fragment")
+
+
+with tab_chat:
+    render_chat()
+
 # ---------- GOVT RESOURCES (same links) ----------
 with tab_news:
     st.header("Latest (Central & State) — Official updates & resources")